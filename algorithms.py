@@ -1,161 +1,291 @@
 from itertools             import combinations
 from collections           import defaultdict
-from city                  import distance
-import heapq
+from city                  import GeoCity, Euc_2D
+from dataclasses           import dataclass
+from functools             import cache, cached_property
 import numpy as np
-from random import randint
-from typing import List, Optional, Tuple
+from typing import Optional, Tuple
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional: the kernels below then run as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
+    HAVE_NUMBA = False
+
+def build_dist_matrix(tsp):
+    """
+    Dense (n, n) float64 matrix of TSPLIB distances, D[i-1, j-1] = distance(city i, city j).
+    Vectorized over the city coordinates; matches city.distance for both metrics.
+    The search kernels only read this table, so no sqrt/acos is evaluated on their hot paths.
+    Intermediates are updated in place, so peak memory stays at a few n×n arrays.
+    """
+    cities = tsp["CITIES"]
+    if type(cities[0]) == GeoCity:
+        coords = np.asarray([c.coord_tuple() for c in cities], dtype=np.float64)
+        lat, lon = coords[:, 0], coords[:, 1]
+        q1 = np.subtract.outer(lon, lon)
+        q2 = np.subtract.outer(lat, lat)
+        q3 = np.add.outer(lat, lat)
+        for q in (q1, q2, q3):
+            np.cos(q, out=q)
+        # (1 + q1) q2 - (1 - q1) q3  ==  (q2 - q3) + q1 (q2 + q3)
+        q2 -= q3                  # q2 - q3
+        q3 *= 2
+        q3 += q2                  # q2 + q3
+        D = q1
+        D *= q3
+        D += q2
+        del q2, q3
+        D *= 0.5
+        np.clip(D, -1.0, 1.0, out=D)
+        np.arccos(D, out=D)
+        radius = 6378.388
+        D *= radius
+        D += 1
+        np.trunc(D, out=D)        # truncate, as per TSPLIB 95
+        same = np.equal.outer(lat, lat) & np.equal.outer(lon, lon)
+        D[same] = 0
+    elif type(cities[0]) == Euc_2D:
+        coords = np.asarray([(c.x, c.y) for c in cities], dtype=np.float64)
+        x, y = coords[:, 0], coords[:, 1]
+        D  = np.subtract.outer(x, x)
+        dy = np.subtract.outer(y, y)
+        np.hypot(D, dy, out=D)
+        del dy
+        np.around(D, out=D)
+    else:
+        raise ValueError(f"Unsupported city type: {type(cities[0]).__name__}")
+    return D
+
+def path_length(D, tour):
+    """Sum of D over consecutive city‐pairs in `tour` (including return), via fancy indexing."""
+    t = np.asarray(tour) - 1
+    return float(D[t[:-1], t[1:]].sum())
+
+def neighbor_lists(D, k=None):
+    """
+    Candidate lists for k-opt: row c holds the `k` nearest other cities to c (zero-based),
+    nearest first. Defaults to max(20, ⌈0.2n⌉) neighbours, capped at n-1.
+    """
+    n = D.shape[0]
+    k = min(n - 1, k or max(20, int(np.ceil(0.2 * n))))
+    part  = np.argpartition(D, k, axis=1)[:, :k+1] if k + 1 < n else np.tile(np.arange(n), (n, 1))
+    order = np.take_along_axis(part, np.argsort(np.take_along_axis(D, part, axis=1), axis=1, kind="stable"), axis=1)
+    # drop each city from its own list (or the farthest entry, if coincident cities crowded it out)
+    keep = order != np.arange(n)[:, None]
+    keep[keep.all(axis=1), -1] = False
+    return order[keep].reshape(n, k).astype(np.int32)
+
+def mst_adjacency(D):
+    """
+    Minimum spanning tree of the complete graph on D, via dense Prim's (O(n²), no heap).
+    Returns a defaultdict(list) adjacency over 1-based city indices.
+    """
+    n = D.shape[0]
+    key     = D[0].copy()            # key[v] = cheapest edge from the tree to v
+    parent  = np.zeros(n, dtype=np.int64)
+    in_tree = np.zeros(n, dtype=np.bool_)
+    in_tree[0] = True
+    key[0]     = np.inf
+
+    adj = defaultdict(list)
+    for _ in range(n - 1):
+        v = int(np.argmin(key))
+        u = int(parent[v])
+        adj[u+1].append(v+1)
+        adj[v+1].append(u+1)
+        in_tree[v] = True
+        key[v]     = np.inf
+        row    = D[v]
+        closer = (row < key) & ~in_tree
+        key[closer]    = row[closer]
+        parent[closer] = v
+    return adj
+
+@dataclass
+class TSPContext:
+    """
+    Per-instance precomputations shared by every algorithm run on `tsp`.
+    Each attribute is built on first access and then reused.
+    """
+    tsp: dict
+
+    @cached_property
+    def D(self):
+        return build_dist_matrix(self.tsp)
+
+    @cached_property
+    def neigh(self):
+        return neighbor_lists(self.D)
 
-def path_length(tsp, tour):
-    """Iterative sum over consecutive city‐pairs in `tour` (including return)."""
-    total = 0
-    for u, v in zip(tour, tour[1:]):
-        total += distance(tsp["CITIES"][u-1], tsp["CITIES"][v-1])
-    return total
+    @cached_property
+    def mst_adj(self):
+        """MST adjacency from mst_adjacency(D); treat as read-only (copy before adding edges)."""
+        return mst_adjacency(self.D)
 
 # === Approx MST ===
-def approx_tsp_tour(tsp):
+def approx_tsp_tour(tsp, ctx=None):
     """
     2-approximation for metric TSP via MST preorder walk.
     Returns (tour_length, tour_list), where tour_list is a sequence of 1-based city indices.
     """
-    n    = tsp["DIMENSION"]
-    dist = lambda i, j: distance(tsp["CITIES"][i-1], tsp["CITIES"][j-1])
+    ctx  = ctx or TSPContext(tsp)
+    D    = ctx.D
 
     # 1) pick a root
     root = 1
 
-    # 2) build MST of the complete graph via Prim’s algorithm
-    visited = {root}
-    adj     = defaultdict(list)         # adjacency list of MST
-    heap    = []
-    # initialize edges out of root
-    for v in range(2, n+1):
-        heapq.heappush(heap, (dist(root, v), root, v))
-
-    while heap and len(visited) < n:
-        weight, u, v = heapq.heappop(heap)
-        if v in visited:
-            continue
-        # add edge u–v to MST
-        visited.add(v)
-        adj[u].append(v)
-        adj[v].append(u)
-        # push edges from v to all still-unvisited
-        for w in range(1, n+1):
-            if w not in visited:
-                heapq.heappush(heap, (dist(v, w), v, w))
+    # 2) build MST of the complete graph
+    adj = ctx.mst_adj
 
     # 3) do a preorder traversal of the MST
+    #    (explicit stack; children pushed in reverse so they pop in adjacency order)
     preorder = []
-    def dfs(u, parent=None):
+    stack    = [(root, None)]
+    while stack:
+        u, parent = stack.pop()
         preorder.append(u)
-        for w in adj[u]:
+        for w in reversed(adj[u]):
             if w != parent:
-                dfs(w, u)
-
-    dfs(root)
+                stack.append((w, u))
 
     # 4) close the cycle by returning to root
     tour = preorder + [root]
 
-    # compute its length
-    total_cost = 0
-    for u, v in zip(tour, tour[1:]):
-        total_cost += dist(u, v)
-
-    return total_cost, tour
+    return path_length(D, tour), tour
 
 # === Held–Karp exact DP ===
-def held_karp(tsp):
-    n = tsp["DIMENSION"]
-    dist = lambda i,j: distance(tsp["CITIES"][i-1], tsp["CITIES"][j-1])
-    # dp[(mask, end)] = minimal cost to start at 1, visit set mask (bitmask over {2..n}), and end at 'end'
-    dp = {}
+# dp[mask, b] = minimal cost to start at 1, visit set mask (bitmask over {2..n}), and end at city b+2.
+# Endpoints outside `mask` stay at inf, so they never win a min().
+
+# no fastmath here: it lets LLVM assume values are finite, and the table relies on inf
+@njit(cache=True)
+def held_karp_core(D):
+    """Fill the Held–Karp table with plain bit loops; masks in increasing order see every prev_mask first."""
+    m = D.shape[0] - 1
+    dp = np.full((1 << m, m), np.inf)
     # base: visit only city 1 then j
-    for j in range(2, n+1):
-        dp[(1<<(j-2), j)] = dist(1, j)
-
-    for size in range(2, n):
-        # all subsets of {2..n} of size `size`
-        for subset in combinations(range(2, n+1), size):
-            mask = sum(1<<(j-2) for j in subset)
-            for j in subset:  # endpoint
-                prev_mask = mask ^ (1<<(j-2))
-                dp[(mask, j)] = min(
-                    dp[(prev_mask, k)] + dist(k, j)
-                    for k in subset if k != j
-                )
-
-    full_mask = (1<<(n-1)) - 1
-    # close the tour back to 1
-    best_cost, best_end = min(
-        (dp[(full_mask, j)] + dist(j, 1), j)
-        for j in range(2, n+1)
-    )
-
-    # (Optional) Reconstruct path by backtracking through dp; omitted here for brevity
-    # but you could store a `parent` dict during the DP fill.
+    for j in range(m):
+        dp[1 << j, j] = D[0, j+1]
+
+    for mask in range(1, 1 << m):
+        if mask & (mask - 1) == 0:
+            continue  # singletons are the base case
+        for j in range(m):  # endpoint
+            if not (mask >> j) & 1:
+                continue
+            prev_mask = mask ^ (1 << j)
+            best = np.inf
+            for k in range(m):
+                cost = dp[prev_mask, k] + D[k+1, j+1]
+                if cost < best:
+                    best = cost
+            dp[mask, j] = best
+    return dp
+
+def _held_karp_table(D):
+    """NumPy fallback for held_karp_core: one vectorized min per (subset size, endpoint)."""
+    m = D.shape[0] - 1
+    dp = np.full((1 << m, m), np.inf)
+    # base: visit only city 1 then j
+    bits = np.arange(m)
+    dp[1 << bits, bits] = D[0, 1:]
+
+    masks    = np.arange(1 << m)
+    popcount = np.zeros(1 << m, dtype=np.int32)
+    for b in range(m):
+        popcount += (masks >> b) & 1
+
+    for size in range(2, m + 1):
+        # all subsets of {2..n} of size `size`, vectorized per endpoint
+        level = masks[popcount == size]
+        for j in range(m):
+            ends      = level[((level >> j) & 1) == 1]
+            prev_mask = ends ^ (1 << j)
+            dp[ends, j] = np.min(dp[prev_mask] + D[1:, j+1], axis=1)
+    return dp
+
+def held_karp(tsp, ctx=None):
+    n = tsp["DIMENSION"]
+    D = (ctx or TSPContext(tsp)).D
+    m = n - 1                 # cities 2..n are bits 0..m-1 of a mask
+    D_sub = D[1:, 1:]         # D_sub[b, c] = distance between cities b+2 and c+2
+    dp = held_karp_core(D) if HAVE_NUMBA else _held_karp_table(D)
 
-    # Just return the cost, and a dummy tour if you don’t need exact sequence:
-    # You can also reconstruct if you want the actual node order.
-    dummy_tour = [1] + list(range(2, n+1)) + [1]
-    return best_cost, dummy_tour
+    full_mask = (1 << m) - 1
+    # close the tour back to 1
+    closing   = dp[full_mask] + D[1:, 0]
+    best_end  = int(np.argmin(closing))
+    best_cost = float(closing[best_end])
+
+    # reconstruct the path by backtracking through dp
+    path, mask, j = [], full_mask, best_end
+    while True:
+        path.append(j + 2)
+        prev_mask = mask ^ (1 << j)
+        if prev_mask == 0:
+            break
+        mask, j = prev_mask, int(np.argmin(dp[prev_mask] + D_sub[:, j]))
+
+    tour = [1] + path[::-1] + [1]
+    return best_cost, tour
 
 # === Christofides heuristic ===
-def christofides(tsp):
-    n = tsp["DIMENSION"]
-    dist = lambda i,j: distance(tsp["CITIES"][i-1], tsp["CITIES"][j-1])
+def christofides(tsp, ctx=None):
+    import networkx as nx  # only Christofides needs it, for the matching below
 
-    # 1) Build full graph’s MST via Prim’s
-    visited = {1}
-    edges   = []
-    import heapq
-    heap = []
-    for v in range(2, n+1):
-        heapq.heappush(heap, (dist(1,v), 1, v))
+    ctx = ctx or TSPContext(tsp)
+    D   = ctx.D
 
-    adj = defaultdict(list)
-    while heap and len(visited) < n:
-        d, u, v = heapq.heappop(heap)
-        if v in visited: continue
-        visited.add(v)
-        adj[u].append(v)
-        adj[v].append(u)
-        for w in range(1, n+1):
-            if w not in visited:
-                heapq.heappush(heap, (dist(v,w), v, w))
+    # 1) Build full graph’s MST (copied: the matching and Euler walk below modify it)
+    adj = defaultdict(list, {u: list(nbrs) for u, nbrs in ctx.mst_adj.items()})
 
     # 2) Find odd‐degree vertices in MST
     odd = [v for v, nbrs in adj.items() if len(nbrs) % 2 == 1]
 
-    # 3) Do a minimum‐weight perfect matching on the induced complete subgraph of `odd`.
-    #   Here we do a *greedy* matching (not optimal) for simplicity:
-    unmatched = set(odd)
-    matching = []
-    while unmatched:
-        u = unmatched.pop()
-        v = min(unmatched, key=lambda x: dist(u,x))
-        unmatched.remove(v)
-        matching.append((u, v))
+    # 3) Do a minimum‐weight perfect matching on the induced complete subgraph of `odd`
+    #    (blossom algorithm; this is what gives Christofides its 1.5× bound). networkx < 3.0 does
+    #    not guarantee a perfect matching from min_weight_matching, hence the README pin.
+    G = nx.Graph()
+    G.add_weighted_edges_from((u, v, D[u-1, v-1]) for u, v in combinations(odd, 2))
+    matching = nx.min_weight_matching(G)
+    for u, v in matching:
         adj[u].append(v)
         adj[v].append(u)
-    
+
     def eulerian_tour(adj, start=1):
         """
         Hierholzer’s algorithm for finding an Eulerian circuit in an undirected multigraph.
-        `adj` is a dict: node → list of neighbor nodes (you’ll destroy these lists).
+        `adj` is a dict: node → list of neighbor nodes (each edge listed at both ends).
+        Every edge gets an id, so taking it from one end retires it at the other in O(1).
         Returns the circuit as a list of vertices, in visit order.
         """
+        incident  = defaultdict(list)   # node → [(neighbor, edge id), ...]
+        num_edges = 0
+        for u, nbrs in adj.items():
+            for v in nbrs:
+                if u < v:
+                    incident[u].append((v, num_edges))
+                    incident[v].append((u, num_edges))
+                    num_edges += 1
+        used = [False] * num_edges
+
         stack   = [start]
         circuit = []
 
         while stack:
-            u = stack[-1]
-            if adj[u]:
-                v = adj[u].pop()      # take any edge u–v
-                adj[v].remove(u)      # remove the back‐edge
-                stack.append(v)       # descend to v
+            u     = stack[-1]
+            edges = incident[u]
+            while edges and used[edges[-1][1]]:
+                edges.pop()               # drop edges already taken from the other end
+            if edges:
+                v, eid = edges.pop()      # take any edge u–v
+                used[eid] = True
+                stack.append(v)           # descend to v
             else:
                 circuit.append(stack.pop())  # backtrack: no more edges
         # circuit is in reverse order
@@ -171,148 +301,279 @@ def christofides(tsp):
             seen.add(v)
     tour.append(1)
 
-    return path_length(tsp, tour), tour
+    return path_length(D, tour), tour
 
 # === 2-opt local search ===
-def two_opt(tsp, tour: List[int], dist_matrix: np.ndarray) -> Tuple[List[int], float]:
+@njit(cache=True)
+def _reverse(tour, i, j):
+    """Reverse tour[i..j] (inclusive) in place."""
+    while i < j:
+        tour[i], tour[j] = tour[j], tour[i]
+        i += 1
+        j -= 1
+
+@njit(cache=True)
+def _reindex(tour, pos, i, j):
+    """Refresh pos[] for the cities at tour[i..j] after they moved."""
+    for p in range(i, j+1):
+        pos[tour[p]] = p
+
+# serial on purpose: a prange best-improvement scan applies one move per O(n²) pass,
+# which costs more than this first-improvement sweep gains from extra threads
+@njit(cache=True, fastmath=True)
+def two_opt_core(tour, D, neigh):
     """
-    Perform 2-opt local search on the tour.
-    Returns improved tour and its length.
+    First-improvement 2-opt over a zero-based np.int32 tour (closed, tour[0] == tour[-1]).
+    For each city v, only moves that replace one of v's tour edges (v, w) by an edge
+    to a candidate neighbour `neigh[v]` closer than D[v, w] are tried.
+    Cities whose last scan found nothing keep a don't-look bit until a move touches them.
+    Mutates `tour` in place and returns the total change in tour length.
     """
     n = len(tour) - 1  # Exclude the last city (return to start)
-    best_tour = tour[:]
-    best_length = path_length(tsp, best_tour)
+    pos = np.empty(n, np.int32)  # pos[city] = index in tour; tour[0] stays put
+    _reindex(tour, pos, 0, n-1)
+    dontlook = np.zeros(n, np.bool_)
+    gain = 0.0
     improved = True
 
     while improved:
         improved = False
-        for i in range(1, n-2):
-            for j in range(i+2, n):
-                old_dist = (dist_matrix[tour[i-1]-1, tour[i]-1] + 
-                           dist_matrix[tour[j]-1, tour[j+1]-1])
-                new_dist = (dist_matrix[tour[i-1]-1, tour[j]-1] + 
-                           dist_matrix[tour[i]-1, tour[j+1]-1])
-                if new_dist < old_dist:
-                    new_tour = tour[:i] + tour[i:j+1][::-1] + tour[j+1:]
-                    new_length = path_length(tsp, new_tour)
-                    if new_length < best_length:
-                        best_tour = new_tour
-                        best_length = new_length
-                        improved = True
-    return best_tour, best_length
+        for v in range(n):
+            if dontlook[v]:
+                continue
+            p = pos[v]
+            moved = False
+
+            # successor edge (v, b): new edge (v, c), drop (c, succ c), add (b, succ c)
+            i = p + 1
+            a, b = v, tour[i]
+            d_ab = D[a, b]
+            for c in neigh[a]:
+                if D[a, c] >= d_ab:
+                    break
+                j = pos[c]
+                y = tour[j+1]
+                delta = (D[a, c] + D[b, y]) - (d_ab + D[c, y])
+                if delta < 0 and (j >= i or j < i-1):
+                    # the delta is exact, so apply the reversal without re-measuring the tour
+                    lo, hi = (i, j) if j >= i else (j+1, i-1)
+                    moved = True
+                    break
+
+            # predecessor edge (a, v): new edge (v, c), drop (pred c, c), add (a, pred c)
+            if not moved:
+                i = p if p > 0 else n  # tour[0] is also tour[n]
+                a, b = tour[i-1], v
+                d_ab = D[a, b]
+                for c in neigh[b]:
+                    if D[b, c] >= d_ab:
+                        break
+                    j = pos[c] if c != tour[0] else n
+                    y = tour[j-1]
+                    delta = (D[b, c] + D[a, y]) - (d_ab + D[y, c])
+                    if delta < 0 and j != i:
+                        lo, hi = (i, j-1) if j > i else (j, i-1)
+                        moved = True
+                        break
+
+            if moved:
+                _reverse(tour, lo, hi)
+                _reindex(tour, pos, lo, hi)
+                gain += delta
+                dontlook[a] = dontlook[b] = dontlook[c] = dontlook[y] = False
+                improved = True
+            else:
+                dontlook[v] = True
+    return gain
+
+def two_opt(tour: np.ndarray, D: np.ndarray, neigh: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float]:
+    """
+    Perform 2-opt local search on the tour.
+    `neigh` is the candidate list from neighbor_lists(D); pass it in when calling repeatedly.
+    Returns improved tour (np.int32 array) and its length.
+    """
+    t = np.asarray(tour, dtype=np.int32) - 1  # zero-based copy for the kernel
+    gain = two_opt_core(t, D, neighbor_lists(D) if neigh is None else neigh)
+    return t + 1, path_length(D, tour) + gain
 
 # === 3-opt local search ===
-def three_opt(tsp, tour: List[int], dist_matrix: np.ndarray) -> Tuple[List[int], float]:
+@njit(cache=True, fastmath=True)
+def three_opt_core(tour, D, neigh):
     """
-    Perform 3-opt optimization on a TSP tour.
-    
-    Args:
-        tsp: TSP instance dictionary containing "CITIES" and "DIMENSION".
-        tour: List of city indices representing the initial tour (e.g., [1, 2, 3, 1]).
-        dist_matrix: Distance matrix where dist_matrix[i-1][j-1] is the distance from city i to j.
-    
-    Returns:
-        Tuple of (optimized tour, tour length).
+    First-improvement 3-opt over a zero-based np.int32 tour (closed, tour[0] == tour[-1]).
+    The first removed edge (a, b) is only replaced by an edge from a to one of its
+    candidate neighbours `neigh` closer than D[a, b]; that neighbour fixes j.
+    Anchors whose last scan found nothing keep a don't-look bit until a move touches them.
+    kernels.pyx mirrors this function move for move; change both together.
+    Mutates `tour` in place and returns the total change in tour length.
     """
     n = len(tour) - 1  # Number of cities excluding the duplicate endpoint (e.g., 14 for burma14.tsp)
-    best_tour = tour[:]
-    best_length = path_length(tsp, best_tour)
-    improved = True
-
-    while improved:
+    pos = np.empty(n, np.int32)  # pos[city] = index in tour; tour[0] stays put
+    _reindex(tour, pos, 0, n-1)
+    dontlook = np.zeros(n, np.bool_)
+    gain = 0.0
+
+    # Segments: A = tour[:i] (ends in a), B = tour[i:j] (b..c), C = tour[j:k] (d..e), rest starts at f.
+    # "Reverse C" alone is the "reverse B" move anchored one edge later, so it is not tried separately.
+    # Candidates only look forward from a, so once a sweep stalls the tour is flipped and swept again.
+    # Anchors are swept by position and the sweep restarts after each move: with the don't-look bits
+    # a restart is cheap, and visiting anchors longest edge first measured slower at equal quality.
+    stale = 0
+    while stale < 2:
         improved = False
-        for i in range(1, n - 4):  # Adjusted to ensure enough space for j and k
-            for j in range(i + 2, n - 2):  # Adjusted to ensure k can be at least j+2
-                for k in range(j + 2, n):  # Stop at n-1 to avoid out-of-range
-                    # Define the six vertices involved in the 3-opt move
-                    a, b = tour[i - 1], tour[i]      # Edge (a, b) at position i-1 to i
-                    c, d = tour[j - 1], tour[j]      # Edge (c, d) at position j-1 to j
-                    e, f = tour[k - 1], tour[k]      # Edge (e, f) at position k-1 to k
-
-                    # Original distance of the three edges to remove
-                    orig_dist = (dist_matrix[a-1, b-1] + dist_matrix[c-1, d-1] + dist_matrix[e-1, f-1])
+        for i in range(1, n - 1):  # every edge but the closing one; the flipped sweep covers that
+            a, b = tour[i - 1], tour[i]      # Edge (a, b) at position i-1 to i
+            if dontlook[a]:
+                continue
+            for x in neigh[a]:
+                if D[a, x] >= D[a, b]:
+                    break
 
-                    # Case 1: a-d-e-b-c-f (pure 3-opt move)
-                    new_dist1 = (dist_matrix[a-1, d-1] + dist_matrix[e-1, b-1] + dist_matrix[c-1, f-1])
-                    if new_dist1 < orig_dist:
-                        new_tour = tour[:i] + tour[j-1:k-1:-1] + tour[i:j] + tour[k:]
-                        best_tour = new_tour
-                        best_length = path_length(tsp, best_tour)
-                        improved = True
-                        break
+                # x == c: new edge (a, c), used by "reverse B" and "reverse B and C"
+                j = pos[x] + 1
+                if i + 2 <= j <= n:
+                    c, d = tour[j - 1], tour[j]      # Edge (c, d) at position j-1 to j
 
-                    # Case 2: a-b-e-d-c-f (includes a 2-opt move)
-                    new_dist2 = (dist_matrix[a-1, b-1] + dist_matrix[e-1, d-1] + dist_matrix[c-1, f-1])
-                    if new_dist2 < orig_dist:
-                        new_tour = tour[:i] + tour[j:k] + tour[i:j] + tour[k:]
-                        best_tour = new_tour
-                        best_length = path_length(tsp, best_tour)
+                    # Case 3: a-c..b-d..e-f (includes a 2-opt move: reverse B)
+                    delta = (D[a, c] + D[b, d]) - (D[a, b] + D[c, d])
+                    if delta < 0:
+                        _reverse(tour, i, j - 1)
+                        _reindex(tour, pos, i, j - 1)
+                        gain += delta
+                        dontlook[a] = dontlook[b] = dontlook[c] = dontlook[d] = False
                         improved = True
                         break
 
-                    # Case 3: a-d-c-b-e-f (includes a 2-opt move)
-                    new_dist3 = (dist_matrix[a-1, d-1] + dist_matrix[c-1, b-1] + dist_matrix[e-1, f-1])
-                    if new_dist3 < orig_dist:
-                        new_tour = tour[:i] + tour[j-1:i-1:-1] + tour[k-1:j-1:-1] + tour[k:]
-                        best_tour = new_tour
-                        best_length = path_length(tsp, best_tour)
-                        improved = True
+                    for k in range(j + 2, n + 1):  # k == n removes the closing edge (e, tour[0])
+                        e, f = tour[k - 1], tour[k]  # Edge (e, f) at position k-1 to k
+                        orig_dist = D[a, b] + D[c, d] + D[e, f]
+
+                        # Case 4: a-c..b-e..d-f (pure 3-opt move: reverse both B and C)
+                        new_dist = D[a, c] + D[b, e] + D[d, f]
+                        if new_dist < orig_dist:
+                            _reverse(tour, i, j - 1)
+                            _reverse(tour, j, k - 1)
+                            _reindex(tour, pos, i, k - 1)
+                            gain += new_dist - orig_dist
+                            dontlook[a] = dontlook[b] = dontlook[c] = False
+                            dontlook[d] = dontlook[e] = dontlook[f] = False
+                            improved = True
+                            break
+                    if improved:
                         break
 
-                    # Case 4: a-f-c-d-e-b (pure 3-opt move with different reversal)
-                    new_dist4 = (dist_matrix[a-1, f-1] + dist_matrix[c-1, d-1] + dist_matrix[e-1, b-1])
-                    if new_dist4 < orig_dist:
-                        new_tour = tour[:i] + tour[k-1:j-1:-1] + tour[j:i:-1] + tour[k:]
-                        best_tour = new_tour
-                        best_length = path_length(tsp, best_tour)
-                        improved = True
+                # x == d: new edge (a, d), used by "swap B and C"
+                j = pos[x]
+                if i + 2 <= j:
+                    c, d = tour[j - 1], tour[j]
+                    for k in range(j + 2, n + 1):
+                        e, f = tour[k - 1], tour[k]
+                        orig_dist = D[a, b] + D[c, d] + D[e, f]
+
+                        # Case 1: a-d..e-b..c-f (pure 3-opt move: swap B and C)
+                        new_dist = D[a, d] + D[e, b] + D[c, f]
+                        if new_dist < orig_dist:
+                            # B C -> C B as three in-place reversals: (B C)^r = C^r B^r, then undo each
+                            _reverse(tour, i, k - 1)
+                            _reverse(tour, i, i + (k - j) - 1)
+                            _reverse(tour, i + (k - j), k - 1)
+                            _reindex(tour, pos, i, k - 1)
+                            gain += new_dist - orig_dist
+                            dontlook[a] = dontlook[b] = dontlook[c] = False
+                            dontlook[d] = dontlook[e] = dontlook[f] = False
+                            improved = True
+                            break
+                    if improved:
                         break
-
-                if improved:
-                    break
             if improved:
                 break
+            dontlook[a] = True
         if improved:
-            tour = best_tour[:]
-
-    return best_tour, best_length
+            stale = 0
+        else:
+            # bits are per orientation: a city's successor edge becomes its predecessor edge
+            stale += 1
+            _reverse(tour, 1, n - 1)
+            _reindex(tour, pos, 1, n - 1)
+            dontlook[:] = False
+
+    return gain
+
+@cache
+def _three_opt_kernel():
+    """
+    Cython build of three_opt_core from kernels.pyx, or None without Cython or a working compiler.
+    Only used when Numba is missing. pyximport compiles it on the first 3-opt call (later runs
+    reuse its build cache); the result, including a failed build, is cached per process, and the
+    import hook is removed right after.
+    """
+    try:
+        import pyximport
+    except ImportError:
+        return None
+    hooks = pyximport.install(language_level=3)
+    try:
+        from kernels import three_opt_kernel
+        return three_opt_kernel
+    except ImportError:
+        return None
+    finally:
+        pyximport.uninstall(*hooks)
+
+def three_opt(tour: np.ndarray, D: np.ndarray, neigh: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float]:
+    """
+    Perform 3-opt optimization on a TSP tour.
+    
+    Args:
+        tour: Array of city indices representing the initial tour (e.g., [1, 2, 3, 1]).
+        D: Distance matrix where D[i-1][j-1] is the distance from city i to j.
+        neigh: Candidate lists from neighbor_lists(D); computed here if omitted.
+    
+    Returns:
+        Tuple of (optimized tour as np.int32 array, tour length).
+    """
+    t = np.asarray(tour, dtype=np.int32) - 1  # zero-based copy for the kernel
+    neigh  = neighbor_lists(D) if neigh is None else neigh
+    # without Numba three_opt_core runs as plain Python, so try the Cython build instead
+    kernel = three_opt_core if HAVE_NUMBA else (_three_opt_kernel() or three_opt_core)
+    length = path_length(D, tour) + kernel(t, np.ascontiguousarray(D), neigh)
+    return t + 1, length
 
 # === FuzzOpt heuristic ===
-def fuzzopt(tsp, max_iterations: Optional[int] = None, use_three_opt: bool = False):
+def fuzzopt(tsp, max_iterations: Optional[int] = None, use_three_opt: bool = False, ctx=None):
     """
     FuzzOpt iterative local search heuristic for TSP with optional 3-opt.
     Returns (tour_length, tour_list), where tour_list is a sequence of 1-based city indices.
     """
     n = tsp["DIMENSION"]
-    dist = lambda i, j: distance(tsp["CITIES"][i-1], tsp["CITIES"][j-1])
-
-    # Create distance matrix
-    distance_matrix = np.zeros((n, n))
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            distance_matrix[i-1, j-1] = dist(i, j)
+    ctx = ctx or TSPContext(tsp)
+    D, neigh = ctx.D, ctx.neigh
 
     # Initialize random tour starting and ending at city 1
-    x = [1] + list(np.random.permutation(list(range(2, n+1)))) + [1]
-    fx = path_length(tsp, x)
+    x = np.concatenate(([1], np.random.permutation(np.arange(2, n+1)), [1])).astype(np.int32)
+    fx = path_length(D, x)
     max_iterations = max_iterations or n
 
     # Choose local search method
     local_search = three_opt if use_three_opt else two_opt
 
+    # Draw every perturbation up front: swap positions us[t] and vs[t] (excluding start/end)
+    us = np.random.randint(1, n, size=max_iterations)
+    vs = np.random.randint(1, n, size=max_iterations)
+    same = us == vs
+    vs[same] = vs[same] % (n-1) + 1
+
     for iteration in range(max_iterations):
         # Create a perturbed tour by swapping two random cities (excluding start/end)
-        xn = x[:]
-        u, v = randint(1, n-1), randint(1, n-1)
-        while u == v:
-            v = randint(1, n-1)
+        xn = x.copy()
+        u, v = us[iteration], vs[iteration]
         xn[u], xn[v] = xn[v], xn[u]
 
         # Apply chosen local search to the perturbed tour
-        xn, fn = local_search(tsp, xn, distance_matrix)
+        xn, fn = local_search(xn, D, neigh)
 
         if fn < fx:
-            x = xn[:]
+            x = xn  # local search returned a fresh array, no copy needed
             fx = fn
 
     return fx, x
\ No newline at end of file
@@ -0,0 +1,128 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, initializedcheck=False
+"""
+Cython build of the 3-opt kernel: the same search as algorithms.three_opt_core,
+compiled to C over typed memoryviews instead of JIT-compiled by Numba.
+Fallback for installs without Numba: built and imported through pyximport on the first
+algorithms.three_opt call, when Cython is available.
+"""
+import numpy as np
+
+cdef inline void _reverse(int[::1] tour, Py_ssize_t i, Py_ssize_t j) noexcept nogil:
+    """Reverse tour[i..j] (inclusive) in place."""
+    cdef int tmp
+    while i < j:
+        tmp = tour[i]
+        tour[i] = tour[j]
+        tour[j] = tmp
+        i += 1
+        j -= 1
+
+cdef inline void _reindex(int[::1] tour, int[::1] pos, Py_ssize_t i, Py_ssize_t j) noexcept nogil:
+    """Refresh pos[] for the cities at tour[i..j] after they moved."""
+    cdef Py_ssize_t p
+    for p in range(i, j+1):
+        pos[tour[p]] = p
+
+def three_opt_kernel(int[::1] tour, double[:, ::1] D, int[:, ::1] neigh) -> float:
+    """
+    First-improvement 3-opt over a zero-based np.int32 tour (closed, tour[0] == tour[-1]).
+    See algorithms.three_opt_core; both must stay move-for-move identical.
+    Mutates `tour` in place and returns the total change in tour length.
+    """
+    cdef Py_ssize_t n = tour.shape[0] - 1
+    cdef Py_ssize_t num_neigh = neigh.shape[1]
+    cdef int[::1] pos = np.empty(n, dtype=np.int32)
+    cdef unsigned char[::1] dontlook = np.zeros(n, dtype=np.uint8)
+    cdef Py_ssize_t i, j, k, r, q
+    cdef int a, b, c, d, e, f, x
+    cdef double gain = 0.0, delta, orig_dist, new_dist
+    cdef bint improved
+    cdef int stale = 0
+
+    with nogil:
+        _reindex(tour, pos, 0, n-1)
+
+        while stale < 2:
+            improved = False
+            for i in range(1, n - 1):
+                a = tour[i - 1]
+                b = tour[i]
+                if dontlook[a]:
+                    continue
+                for r in range(num_neigh):
+                    x = neigh[a, r]
+                    if D[a, x] >= D[a, b]:
+                        break
+
+                    # x == c: new edge (a, c), used by "reverse B" and "reverse B and C"
+                    j = pos[x] + 1
+                    if i + 2 <= j <= n:
+                        c = tour[j - 1]
+                        d = tour[j]
+
+                        # Case 3: a-c..b-d..e-f (reverse B)
+                        delta = (D[a, c] + D[b, d]) - (D[a, b] + D[c, d])
+                        if delta < 0:
+                            _reverse(tour, i, j - 1)
+                            _reindex(tour, pos, i, j - 1)
+                            gain += delta
+                            dontlook[a] = dontlook[b] = dontlook[c] = dontlook[d] = 0
+                            improved = True
+                            break
+
+                        for k in range(j + 2, n + 1):
+                            e = tour[k - 1]
+                            f = tour[k]
+                            orig_dist = D[a, b] + D[c, d] + D[e, f]
+
+                            # Case 4: a-c..b-e..d-f (reverse both B and C)
+                            new_dist = D[a, c] + D[b, e] + D[d, f]
+                            if new_dist < orig_dist:
+                                _reverse(tour, i, j - 1)
+                                _reverse(tour, j, k - 1)
+                                _reindex(tour, pos, i, k - 1)
+                                gain += new_dist - orig_dist
+                                dontlook[a] = dontlook[b] = dontlook[c] = 0
+                                dontlook[d] = dontlook[e] = dontlook[f] = 0
+                                improved = True
+                                break
+                        if improved:
+                            break
+
+                    # x == d: new edge (a, d), used by "swap B and C"
+                    j = pos[x]
+                    if i + 2 <= j:
+                        c = tour[j - 1]
+                        d = tour[j]
+                        for k in range(j + 2, n + 1):
+                            e = tour[k - 1]
+                            f = tour[k]
+                            orig_dist = D[a, b] + D[c, d] + D[e, f]
+
+                            # Case 1: a-d..e-b..c-f (swap B and C)
+                            new_dist = D[a, d] + D[e, b] + D[c, f]
+                            if new_dist < orig_dist:
+                                _reverse(tour, i, k - 1)
+                                _reverse(tour, i, i + (k - j) - 1)
+                                _reverse(tour, i + (k - j), k - 1)
+                                _reindex(tour, pos, i, k - 1)
+                                gain += new_dist - orig_dist
+                                dontlook[a] = dontlook[b] = dontlook[c] = 0
+                                dontlook[d] = dontlook[e] = dontlook[f] = 0
+                                improved = True
+                                break
+                        if improved:
+                            break
+                if improved:
+                    break
+                dontlook[a] = 1
+            if improved:
+                stale = 0
+            else:
+                stale += 1
+                _reverse(tour, 1, n - 1)
+                _reindex(tour, pos, 1, n - 1)
+                for q in range(n):
+                    dontlook[q] = 0
+
+    return gain
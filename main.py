@@ -2,7 +2,7 @@
 
 from argparser   import build_parser
 from tspparse    import read_tsp_file
-from algorithms  import held_karp, christofides, approx_tsp_tour, fuzzopt
+from algorithms  import held_karp, christofides, approx_tsp_tour, fuzzopt, TSPContext
 from glob        import iglob
 from os.path     import isfile, isdir, join
 
@@ -22,25 +22,26 @@ def main():
     for tsp_path in collect_tsp_files(args.inputs):
         tsp = read_tsp_file(tsp_path)
         name = tsp["NAME"]
+        ctx  = TSPContext(tsp)
 
         if args.use_held_karp:
-            length, tour = held_karp(tsp)
+            length, tour = held_karp(tsp, ctx)
             method = "Held–Karp"
         elif args.use_christofides:
-            length, tour = christofides(tsp)
+            length, tour = christofides(tsp, ctx)
             method = "Christofides"
         elif args.use_mst_approx:
-            length, tour = approx_tsp_tour(tsp)
+            length, tour = approx_tsp_tour(tsp, ctx)
             method = "MST-Preorder(2-Approx)"
         elif args.use_fuzzopt_2opt:
-            length, tour = fuzzopt(tsp, use_three_opt=False)
+            length, tour = fuzzopt(tsp, use_three_opt=False, ctx=ctx)
             method = "FuzzOpt(2-opt)"
         elif args.use_fuzzopt_3opt:
-            length, tour = fuzzopt(tsp, use_three_opt=True)
+            length, tour = fuzzopt(tsp, use_three_opt=True, ctx=ctx)
             method = "FuzzOpt(3-opt)"
 
         print(f"{name} ({tsp_path}):")
-        print(f"  → {method} tour length = {length}")
+        print(f"  → {method} tour length = {int(length)}")
         print(f"  → Tour: {[int(city) for city in tour]}\n")
 
 if __name__ == "__main__":